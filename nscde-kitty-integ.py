@@ -28,71 +28,95 @@ SOFTWARE.
 """
 
 import argparse
-from operator import add, mul, sub
 import sys
 
-BLACK = (0, 0, 0)
-RED = (255, 0, 0)
-GREEN = (0, 255, 0)
-YELLOW = (255, 255, 0)
-BLUE = (0, 0, 255)
-MAGENTA = (255, 0, 255)
-CYAN = (0, 255, 255)
-WHITE = (255, 255, 255)
-
-
-class ColorConfModel:
-    """A model of a kitty color conf file."""
-
-    def __init__(self):
-        """Define the model."""
-        fields = [
-            "foreground",
-            "background",
-            "cursor",
-            "selection_foreground",
-            "selection_background",
-            "color0",
-            "color1",
-            "color2",
-            "color3",
-            "color4",
-            "color5",
-            "color6",
-            "color7",
-            "color8",
-            "color9",
-            "color10",
-            "color11",
-            "color12",
-            "color13",
-            "color14",
-            "color15",
-        ]
-        self.entries = {f: tuple() for f in fields}
-
-
-def tw_to_rgb(thxs):
+import numpy as np
+
+# The primary colors, in the order of kitty's color0-color7, and their row indices.
+TARGETS = np.array(
+    [
+        [0, 0, 0],
+        [255, 0, 0],
+        [0, 255, 0],
+        [255, 255, 0],
+        [0, 0, 255],
+        [255, 0, 255],
+        [0, 255, 255],
+        [255, 255, 255],
+    ],
+    dtype=np.int16,
+)
+BLACK, RED, GREEN, YELLOW, BLUE, MAGENTA, CYAN, WHITE = range(len(TARGETS))
+
+# The entries of a kitty color conf file, in output order.
+FIELDS = (
+    "foreground",
+    "background",
+    "cursor",
+    "selection_foreground",
+    "selection_background",
+    "color0",
+    "color1",
+    "color2",
+    "color3",
+    "color4",
+    "color5",
+    "color6",
+    "color7",
+    "color8",
+    "color9",
+    "color10",
+    "color11",
+    "color12",
+    "color13",
+    "color14",
+    "color15",
+)
+
+# The value of each ASCII hex digit, indexed by byte. Any other byte maps to 0xFF.
+HEX = np.full(256, 0xFF, dtype=np.uint8)
+HEX[np.frombuffer(b"0123456789abcdefABCDEF", dtype=np.uint8)] = [
+    *range(16),
+    *range(10, 16),
+]
+
+
+def tw_to_rgb(raw):
     """
-    Convert a 12-digit hex color to RGB.
+    Convert the contents of an NsCDE palette file to RGB.
+
+    Every line has the fixed layout "#rrrrggggbbbb", so the file is decoded as one
+    (N, 14) byte array instead of line by line. Only the high byte of each 16-bit
+    channel is kept.
 
     Parameters
     ----------
-    thxs : str
-        A 12-digit hex color string.
+    raw : bytes
+        The palette file contents, one 12-digit hex color per line. Any line endings
+        and whitespace around each color are accepted.
 
     Returns
     -------
-    tuple[int]
-        An RGB tuple.
+    numpy.ndarray
+        An (N, 3) array of RGB colors.
     """
-    if len(thxs) != 13:
-        if len(thxs) == 12:
-            raise ValueError("thxs is not correctly formatted (#xxxxxxxxxxxx).")
-        else:
-            print(thxs)
-            raise ValueError("thxs must be 12 digits long with '#' at the beginning.")
-    return (int(thxs[1:3], 16), int(thxs[5:7], 16), int(thxs[9:11], 16))
+    # Normalize line endings and surrounding whitespace, as reading in text mode and
+    # stripping each line would.
+    raw = b"\n".join(line.strip() for line in raw.splitlines()) + b"\n"
+
+    # Validate the layout of every normalized line at once rather than per color. Each
+    # row must be exactly "#" + 12 digits + "\n".
+    lines = np.frombuffer(raw, dtype=np.uint8)
+    if len(lines) % 14:
+        raise ValueError("Colors must be 12 digits long with '#' at the beginning.")
+    lines = lines.reshape(-1, 14)
+    if (lines[:, 0] != ord("#")).any() or (lines[:, 13] != ord("\n")).any():
+        raise ValueError("Colors must be 12 digits long with '#' at the beginning.")
+
+    nibbles = HEX[lines[:, [1, 2, 5, 6, 9, 10]]]
+    if (nibbles == 0xFF).any():
+        raise ValueError("Colors must only contain hex digits after the '#'.")
+    return (nibbles[:, 0::2] * 16 + nibbles[:, 1::2]).astype(np.int16)
 
 
 def rgb_to_hex(rgb):
@@ -109,41 +133,42 @@ def rgb_to_hex(rgb):
     str
         A hex color string.
     """
-    return f"#{rgb[0]:x}{rgb[1]:x}{rgb[2]:x}".upper()
+    return "#%02X%02X%02X" % (rgb[0], rgb[1], rgb[2])
 
 
-def brighten(rgb, values=(20, 20, 20)):
+def brighten_all(rgb, values=(20, 20, 20)):
     """
-    Brighten an RGB color.
+    Brighten an array of RGB colors.
 
-    If the brightened color is over (255, 255, 255), subtract `values` instead of adding
+    If a brightened color is over (255, 255, 255), subtract `values` instead of adding
     `values`, effectively dimming the color. If this results in a negative number,
-    return the original color. This is implemented to guarantee a valid (and hopefully
-    different) color is returned.
+    keep the original color. This is implemented to guarantee a valid (and hopefully
+    different) color is returned for every row.
 
     Parameters
     ----------
-    rgb : tuple[int]
-        An RGB tuple.
+    rgb : numpy.ndarray
+        An (N, 3) array of RGB colors.
     values : tuple[int], optional
         Amount of brightening to apply to R, G, B respectively.
 
     Returns
     -------
-    tuple[int]
-        A brightened RGB color.
+    numpy.ndarray
+        An (N, 3) array of brightened RGB colors.
     """
-    # Apply brightness.
-    br_color = tuple(map(add, rgb, values))
-    if any(i > 255 for i in br_color):
-        br_color = tuple(map(sub, rgb, values))
-    if any(i < 0 for i in br_color):
-        br_color = rgb
+    values = np.asarray(values, dtype=rgb.dtype)
+    if not values.any():
+        return rgb.copy()
 
-    # Make sure elements are ints.
-    br_color = tuple(map(round, br_color))
+    # Apply brightness.
+    br_colors = rgb + values
+    over = br_colors.max(axis=1, keepdims=True) > 255
+    br_colors = np.where(over, rgb - values, br_colors)
+    under = br_colors.min(axis=1, keepdims=True) < 0
+    br_colors = np.where(under, rgb, br_colors)
 
-    return br_color
+    return br_colors
 
 
 def text_color(bg):
@@ -160,43 +185,78 @@ def text_color(bg):
     tuple[int]
         Foreground RGB color.
     """
-    luminance = sum(map(mul, (0.299, 0.587, 0.114), bg)) / 255
-    if luminance > 0.5:
+    # BT.601 luma with the weights scaled by 1000, compared against 0.5 * 255 * 1000.
+    luminance = 299 * bg[0] + 587 * bg[1] + 114 * bg[2]
+    if luminance > 127500:
         fg = (0, 0, 0)
     else:
         fg = (255, 255, 255)
     return fg
 
 
-def closest_color(rgb, colors):
+def closest_colors(targets, colors, order=None):
     """
-    Determine the closest color in `colors` to `rgb`.
+    Match each color in `targets` to a distinct closest color in `colors`.
 
-    WARNING: this function is *destructive*. It removes the result from the input
-    `colors` list. This is to prevent overlapping colors in the color assignment below
-    (starting line 263). It is recommended to pass a copied list to this function if you
-    wish to protect the original list.
+    Targets are matched greedily in `order`, and a matched color is not available to
+    later targets. This is to prevent overlapping colors in the color assignment below.
 
     Parameters
     ----------
-    rgb : tuple[int]
-        An RGB color.
-    colors : list[tuple[int]]
+    targets : numpy.ndarray
+        An (M, 3) array of RGB colors to match.
+    colors : numpy.ndarray
+        An (N, 3) array of RGB colors.
+    order : list[int], optional
+        Row indices of `targets`, in order of priority. Defaults to the row order.
 
     Returns
     -------
-    tuple[int]
-        An RGB color.
+    list[tuple[int]]
+        The matched RGB color for each row of `targets`.
     """
-    r, g, b = rgb
-    color_diffs = []
-    for color in colors:
-        cr, cg, cb = color
-        color_diff = (abs(r - cr) ** 2 + abs(g - cg) ** 2 + abs(b - cb) ** 2) ** (1 / 2)
-        color_diffs.append((color_diff, color))
-    result = min(color_diffs)[1]
-    colors.remove(result)
-    return result
+    if order is None:
+        order = range(len(targets))
+    if len(colors) < len(order):
+        raise ValueError(
+            f"The palette has {len(colors)} colors, but {len(order)} are required."
+        )
+
+    # Sort the colors so that argmin breaks distance ties in favor of the smaller RGB
+    # color.
+    colors = colors[np.lexsort(colors.T[::-1])]
+
+    # All target-to-color squared distances at once; the square root does not change
+    # the ordering.
+    diffs = targets[:, None, :].astype(np.int32) - colors[None, :, :]
+    dists = np.einsum("ijk,ijk->ij", diffs, diffs)
+
+    matches = np.empty_like(targets)
+    for t in order:
+        i = dists[t].argmin()
+        matches[t] = colors[i]
+        dists[:, i] = np.iinfo(dists.dtype).max
+    return [tuple(c) for c in matches.tolist()]
+
+
+def color_value(s):
+    """
+    Parse a command line color channel value.
+
+    Parameters
+    ----------
+    s : str
+        The argument string.
+
+    Returns
+    -------
+    int
+        An integer in the range 0-255.
+    """
+    value = int(s)
+    if not 0 <= value <= 255:
+        raise argparse.ArgumentTypeError(f"{value} is not in the range 0-255.")
+    return value
 
 
 if __name__ == "__main__":
@@ -211,9 +271,8 @@ if __name__ == "__main__":
     parser.add_argument(
         "--brightness",
         action="store",
-        type=int,
+        type=color_value,
         default=20,
-        choices=range(0, 256),
         help=(
             "Specify the overall amount of brightness to add (on a range of 0-255)."
             " This is overwritten by the r, g, b flags, respectively."
@@ -222,25 +281,22 @@ if __name__ == "__main__":
     parser.add_argument(
         "-r",
         action="store",
-        type=int,
+        type=color_value,
         default=0,
-        choices=range(0, 256),
         help="Specify the amount of brightness to add to red elements (R, x, x).",
     )
     parser.add_argument(
         "-g",
         action="store",
-        type=int,
+        type=color_value,
         default=0,
-        choices=range(0, 256),
         help="Specify the amount of brightness to add to green elements (x, G, x).",
     )
     parser.add_argument(
         "-b",
         action="store",
-        type=int,
+        type=color_value,
         default=0,
-        choices=range(0, 256),
         help="Specify the amount of brightness to add to blue elements (x, x, B).",
     )
     parser.add_argument(
@@ -267,8 +323,8 @@ if __name__ == "__main__":
 
     # Read the NsCDE palette file into `colors_12d`.
     try:
-        with open(args.path, "r") as f:
-            colors_12d = f.readlines()
+        with open(args.path, "rb") as f:
+            colors_12d = f.read()
     except Exception as e:
         if args.silent:
             # Silently exit.
@@ -277,67 +333,79 @@ if __name__ == "__main__":
             raise e
 
     # Convert the 12-digit colors to RGB.
-    colors = [tw_to_rgb(i.strip()) for i in colors_12d]
+    colors = tw_to_rgb(colors_12d)
 
+    # In vibrant mode the bright palette is brightened from the already brightened
+    # palette. The two passes stay separate since each row's fallback (dim or keep)
+    # depends on the result of the previous pass.
     if args.vibrant:
-        colors = [brighten(i, brightness) for i in colors]
-        bright_colors = [brighten(i, brightness * 2) for i in colors]
-    else:
-        bright_colors = [brighten(i, brightness) for i in colors]
+        colors = brighten_all(colors, brightness)
+    bright_colors = brighten_all(colors, brightness)
 
-    # Create and populate a kitty color conf model.
-    conf = ColorConfModel()
+    # Populate the kitty color conf entries.
+    entries = dict.fromkeys(FIELDS)
 
     if args.ncolors in [8, 4]:
-        conf.entries["background"] = closest_color(BLACK, colors)
-        fg = text_color(conf.entries["background"])
-        conf.entries["foreground"] = fg
-        conf.entries["cursor"] = closest_color(YELLOW, colors)
-        conf.entries["selection_foreground"] = conf.entries["background"]
-        conf.entries["selection_background"] = conf.entries["foreground"]
+        # The background (black) and cursor (yellow) get first pick of the palette.
+        normal = closest_colors(
+            TARGETS,
+            colors,
+            order=[BLACK, YELLOW, RED, GREEN, BLUE, MAGENTA, CYAN, WHITE],
+        )
+        bright = closest_colors(TARGETS, bright_colors)
+
+        entries["background"] = normal[BLACK]
+        fg = text_color(entries["background"])
+        entries["foreground"] = fg
+        entries["cursor"] = normal[YELLOW]
+        entries["selection_foreground"] = entries["background"]
+        entries["selection_background"] = entries["foreground"]
 
         # Black
-        conf.entries["color0"] = conf.entries["background"]
-        conf.entries["color8"] = closest_color(BLACK, bright_colors)
+        entries["color0"] = entries["background"]
+        entries["color8"] = bright[BLACK]
 
         # Red
-        conf.entries["color1"] = closest_color(RED, colors)
-        conf.entries["color9"] = closest_color(RED, bright_colors)
+        entries["color1"] = normal[RED]
+        entries["color9"] = bright[RED]
 
         # Green
-        conf.entries["color2"] = closest_color(GREEN, colors)
-        conf.entries["color10"] = closest_color(GREEN, bright_colors)
+        entries["color2"] = normal[GREEN]
+        entries["color10"] = bright[GREEN]
 
         # Yellow
-        conf.entries["color3"] = conf.entries["cursor"]
-        conf.entries["color11"] = closest_color(YELLOW, bright_colors)
+        entries["color3"] = entries["cursor"]
+        entries["color11"] = bright[YELLOW]
 
         # Blue
-        conf.entries["color4"] = closest_color(BLUE, colors)
-        conf.entries["color12"] = closest_color(BLUE, bright_colors)
+        entries["color4"] = normal[BLUE]
+        entries["color12"] = bright[BLUE]
 
         # Magenta
-        conf.entries["color5"] = closest_color(MAGENTA, colors)
-        conf.entries["color13"] = closest_color(MAGENTA, bright_colors)
+        entries["color5"] = normal[MAGENTA]
+        entries["color13"] = bright[MAGENTA]
 
         # Cyan
-        conf.entries["color6"] = closest_color(CYAN, colors)
-        conf.entries["color14"] = closest_color(CYAN, bright_colors)
+        entries["color6"] = normal[CYAN]
+        entries["color14"] = bright[CYAN]
 
         # White
-        conf.entries["color7"] = closest_color(WHITE, colors)
-        conf.entries["color15"] = closest_color(WHITE, bright_colors)
+        entries["color7"] = normal[WHITE]
+        entries["color15"] = bright[WHITE]
         # raise ValueError("4 color mode not currently supported.")
     else:
         raise ValueError("ncolors must be either 8 or 4.")
 
+    lines = [
+        "### Color theme generated by nscde-kitty-integ.py.",
+        f"### NsCDE theme: {args.path}",
+    ]
+    lines += [f"{e} {rgb_to_hex(rgb)}" for e, rgb in entries.items()]
+
     try:
         # Write to the kitty color conf location.
         with open(args.theme, "w") as f:
-            f.write("### Color theme generated by nscde-kitty-integ.py.\n")
-            f.write(f"### NsCDE theme: {args.path}\n")
-            for e in conf.entries:
-                f.write(f"{e} {rgb_to_hex(conf.entries[e])}\n")
+            f.write("\n".join(lines) + "\n")
     except Exception as e:
         if args.silent:
             # Silently exit.